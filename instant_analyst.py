@@ -1,176 +1,625 @@
 import os
+import sys
 import argparse
-import feedparser
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import google.generativeai as genai
 import urllib.parse
-from datetime import datetime, timedelta
-import yfinance as yf
-import pandas as pd
 import json
-import io
-from pypdf import PdfReader
+import re
+import html
+import time
+import xml.etree.ElementTree as ET
+from email.utils import parsedate_tz, mktime_tz
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 
 # --- CONFIGURATION ---
-BOT_TOKEN = os.environ['TELEGRAM_BOT_TOKEN']
-GEMINI_API_KEY = os.environ['GEMINI_API_KEY']
+# Secrets are read in _init() so importing (spawned PDF workers, --help) needs none
+BOT_TOKEN = None
+GEMINI_API_KEY = None
+TELEGRAM_URL = None
 
-genai.configure(api_key=GEMINI_API_KEY)
+def _init():
+    global BOT_TOKEN, GEMINI_API_KEY, TELEGRAM_URL
+    missing = [k for k in ('TELEGRAM_BOT_TOKEN', 'GEMINI_API_KEY') if not os.environ.get(k)]
+    if missing:
+        sys.exit(f"❌ Missing env vars: {', '.join(missing)}")
+    BOT_TOKEN = os.environ['TELEGRAM_BOT_TOKEN']
+    GEMINI_API_KEY = os.environ['GEMINI_API_KEY']
+    TELEGRAM_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+    genai.configure(api_key=GEMINI_API_KEY)
+
+FLASH_MODEL = genai.GenerativeModel('gemini-2.5-flash') # Built once, shared by every call
+
+# One pooled session so repeated sends (header + chunked analysis) reuse the same TLS connection.
+# GETs retry transient errors with backoff; POSTs are never retried so Telegram can't double-send.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"]),
+))
+SESSION.headers.update({"User-Agent": "Mozilla/5.0"}) # Yahoo and most filing hosts reject the default UA
+
+# --- DISK CACHE ---
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 86400))
+PDF_CACHE_DIR = "/tmp/pdfcache"
+GEMINI_CACHE_DIR = "/tmp/gemini_cache"
+
+def _cache_path(cache_dir, key):
+    return os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest())
+
+def read_cache(path, ttl=CACHE_TTL):
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+    except OSError:
+        pass
+    return None
+
+def write_cache(path, text):
+    # Write to a temp file and rename, so a killed run never leaves a half-written entry
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Cache Error: {e}")
 
 # --- TELEGRAM HELPER ---
+TELEGRAM_CHUNK = 4000 # Telegram allows 4096 UTF-16 units per message; chunks are measured the same way
+MD_LINK = re.compile(r"\[([^\]]*)\]\(([^)]*)\)")
+MD_CODE = re.compile(r"```(?:\w*\n)?(.+?)```|`([^`\n]+)`", re.S)
+MD_BOLD = re.compile(r"\*\*([^\n]+?)\*\*|(?<![*\w])\*(?=\S)([^*\n]*?\S)\*(?![*\w])")
+
+def _tg_len(text):
+    # Telegram counts UTF-16 code units: emoji and other non-BMP chars take two
+    return len(text.encode("utf-16-le")) // 2
+
+def _tg_prefix(text, limit):
+    # Longest prefix length (in Python chars) that fits in `limit` UTF-16 units
+    units = 0
+    for i, c in enumerate(text):
+        units += 2 if ord(c) > 0xFFFF else 1
+        if units > limit:
+            return i
+    return len(text)
+
+def _hard_split(text, limit):
+    # Last resort for one oversized line: cut at a sentence, then a space, never inside a [..](..) link
+    while _tg_len(text) > limit:
+        fit = _tg_prefix(text, limit)
+        cut = text.rfind(". ", 0, fit) + 2
+        if cut < fit // 2:
+            cut = text.rfind(" ", 0, fit) + 1 or fit
+        for m in MD_LINK.finditer(text):
+            if m.start() >= cut:
+                break
+            if cut < m.end() and m.start() > 0:
+                cut = m.start()
+        yield text[:cut]
+        text = text[cut:]
+    if text:
+        yield text
+
+def _split_message(message, limit=TELEGRAM_CHUNK):
+    """Greedy-packs paragraphs (then lines, then sentences) into chunks of at most `limit` UTF-16 units."""
+    pieces = []
+    for para in re.split(r"(?<=\n\n)", message):
+        if _tg_len(para) <= limit:
+            pieces.append(para)
+            continue
+        for line in re.split(r"(?<=\n)", para):
+            pieces.extend([line] if _tg_len(line) <= limit else _hard_split(line, limit))
+
+    chunks, buf, buf_len = [], "", 0
+    for piece in pieces:
+        piece_len = _tg_len(piece)
+        if buf and buf_len + piece_len > limit:
+            chunks.append(buf)
+            buf, buf_len = "", 0
+        buf += piece
+        buf_len += piece_len
+    chunks.append(buf)
+    return [c.strip() for c in chunks if c.strip()]
+
+def _to_html(chunk):
+    """Renders the Markdown our messages and Gemini replies use (bold, `code`, [text](url)) as Telegram HTML."""
+    # Everything is escaped once and only paired markers become tags, so Telegram always accepts it.
+    # Code and links are stashed first so a bold marker can never overlap them.
+    spans = []
+    def stash(tag):
+        spans.append(tag)
+        return f"\x00{len(spans) - 1}\x00"
+
+    def code(m):
+        if m.group(1) is not None:
+            return stash("<pre>" + html.escape(m.group(1).strip("\n"), quote=False) + "</pre>")
+        return stash("<code>" + html.escape(m.group(2), quote=False) + "</code>")
+
+    text = MD_CODE.sub(code, chunk.replace("\x00", ""))
+    text = MD_LINK.sub(lambda m: stash(f'<a href="{html.escape(m.group(2))}">{html.escape(m.group(1), quote=False)}</a>'), text)
+    text = html.escape(text, quote=False)
+    text = MD_BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    return re.sub(r"\x00(\d+)\x00", lambda m: spans[int(m.group(1))], text)
+
+def _post_one(chat_id, chunk):
+    payload = {
+        "chat_id": chat_id, "text": _to_html(chunk), "parse_mode": "HTML", "disable_web_page_preview": True
+    }
+    try:
+        r = SESSION.post(TELEGRAM_URL, json=payload)
+        if r.status_code != 200:
+            print(f"Telegram Error: {r.status_code} {r.text[:200]}")
+    except Exception as e:
+        print(f"Telegram Error: {e}")
+
 def send_telegram(chat_id, message):
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    chunk_size = 4000
-    for i in range(0, len(message), chunk_size):
-        chunk = message[i:i+chunk_size]
-        payload = {
-            "chat_id": chat_id, "text": chunk, "parse_mode": "Markdown", "disable_web_page_preview": True
-        }
-        try:
-            r = requests.post(url, json=payload)
-            if r.status_code != 200:
-                payload['parse_mode'] = ""
-                requests.post(url, json=payload)
-        except Exception as e:
-            print(f"Telegram Error: {e}")
+    # Chunks of one message go out in order: Telegram doesn't keep concurrent sends ordered
+    for chunk in _split_message(message):
+        _post_one(chat_id, chunk)
+
+def send_many(messages):
+    """Sends independent (chat_id, message) pairs concurrently; each message's own chunks stay ordered."""
+    if not messages:
+        return
+    with ThreadPoolExecutor(max_workers=min(4, len(messages))) as pool:
+        list(pool.map(lambda m: send_telegram(*m), messages))
+
+# --- PDF TEXT EXTRACTION ---
+PDF_MAX_PAGES = 30 # 30 pages for deep reading
+PDF_SERIAL_PAGES = 4 # Below this, worker start-up costs more than it saves
+MAX_PDF_BYTES = 20 << 20
+
+def _open_pdf(path):
+    """Opens `path` with pypdfium2 (PDFium, C++) when it's installed and can read the file, else with pypdf."""
+    try:
+        import pypdfium2 as pdfium
+        return pdfium.PdfDocument(path)
+    except Exception: # Not installed, or a file PDFium refuses
+        from pypdf import PdfReader
+        # A file object, not the path: given a path pypdf reads the whole file into memory
+        return PdfReader(open(path, 'rb'))
+
+def _page_count(doc):
+    return len(doc.pages) if hasattr(doc, 'pages') else len(doc)
+
+def _page_text(doc, i):
+    if hasattr(doc, 'pages'): # pypdf
+        return doc.pages[i].extract_text() or ""
+    textpage = doc[i].get_textpage()
+    try:
+        return textpage.get_text_range().replace("\r\n", "\n")
+    finally:
+        textpage.close()
+
+def _close_pdf(doc):
+    if hasattr(doc, 'pages'):
+        doc.stream.close()
+    else:
+        doc.close()
+
+_worker_doc = None
+
+def _open_worker_doc(path):
+    # Runs once per worker process, so each one parses the file once and keeps its own handle
+    global _worker_doc
+    _worker_doc = _open_pdf(path)
+
+def _extract_page(i):
+    return _page_text(_worker_doc, i)
+
+PAGE_LABEL = re.compile(r"page\s*\d{1,4}(?:\s*of\s*\d{1,4})?|\d{1,4}\s*of\s*\d{1,4}|[-–]\s*\d{1,4}\s*[-–]", re.I)
+HEADER_PAGES = 3 # A line already seen on this many earlier pages is a running header/footer
+EDGE_LINES = 3 # Running headers/footers only ever sit in this many lines at the top or bottom of a page
+
+def _compact_pages(page_texts):
+    """Yields page texts minus running headers/footers, page labels, blank lines and repeated spaces."""
+    # Works page by page so the char budget still stops extraction early; newlines stay for table rows
+    seen = {}
+    for page_no, text in enumerate(page_texts, 1):
+        lines = []
+        for line in text.splitlines():
+            line = " ".join(line.split())
+            if line and line != str(page_no) and not PAGE_LABEL.fullmatch(line):
+                lines.append(line)
+        # Only edge lines are header candidates: body labels like "Revenue" or "Total" repeat on
+        # every statement page and must survive. Figures repeat too, so a header needs words.
+        edges = set(lines[:EDGE_LINES] + lines[-EDGE_LINES:])
+        kept = [line for line in lines
+                if not (line in edges and seen.get(line, 0) >= HEADER_PAGES and any(c.isalpha() for c in line))]
+        for line in edges:
+            seen[line] = seen.get(line, 0) + 1
+        yield "\n".join(kept) + "\n"
+
+def _fill_budget(page_texts, char_cap):
+    # One pass: clip the page that crosses the budget and stop pulling pages, so nothing is sliced twice
+    parts, remaining = [], char_cap
+    for text in page_texts:
+        parts.append(text[:remaining])
+        remaining -= len(parts[-1])
+        if remaining <= 0:
+            break
+    return "".join(parts), len(parts)
+
+def extract_pdf_text(path, char_cap):
+    """Returns (text, pages_read) for up to PDF_MAX_PAGES pages, stopping once `char_cap` chars are in hand."""
+    doc = _open_pdf(path)
+    try:
+        max_pages = min(_page_count(doc), PDF_MAX_PAGES)
+        workers = min(8, os.cpu_count() or 1, max_pages)
+        # PDFium does a 30-page filing in tens of ms, far less than spawning workers; only pypdf needs the pool.
+        # A single worker would just re-import this module (~1s for google.generativeai) to do the serial loop.
+        if max_pages <= PDF_SERIAL_PAGES or workers < 2 or not hasattr(doc, 'pages'):
+            return _fill_budget(_compact_pages(_page_text(doc, i) for i in range(max_pages)), char_cap)
+    finally:
+        _close_pdf(doc)
+
+    # pypdf is pure Python, so only separate processes get around the GIL.
+    # spawn rather than fork: the parent may already hold HTTP/gRPC client state.
+    ex = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_open_worker_doc,
+        initargs=(path,),
+    )
+    try:
+        # Results arrive in page order; once the budget is full the queued pages are cancelled
+        return _fill_budget(_compact_pages(ex.map(_extract_page, range(max_pages))), char_cap)
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)
+
+# --- PDF PROMPTS (DUAL MODE) ---
+# Per mode: document text budget, CTX line, document label, and the instructions sent after the document.
+# The {symbol}/{current_price} inside the instructions are left for Gemini to fill in its reply.
+PDF_PROMPTS = {
+    # --- PROMPT A: STRATEGIC FUTURE OUTLOOK ---
+    "FUTURE": {
+        "char_cap": 90000,
+        "context": "CTX: STOCK {symbol} | CMP {current_price} | DOC TYPE: Corporate Filing\n",
+        "doc": "DOC TEXT (First {pages} pgs): {text}\n",
+        "instructions": (
+            "ROLE: Senior Growth Strategist.\n"
+            "TASK: Analyze specifically for FUTURE PROSPECTS & GROWTH STRATEGY.\n"
+            "INSTRUCTIONS: Detect doc type (Annual/Quarterly/Concall) and extract forward-looking info.\n\n"
+            "OUTPUT FORMAT (Strictly):\n"
+            "🚀 **STRATEGIC FUTURE OUTLOOK: {symbol}**\n\n"
+            "1️⃣ **Strategic Outlook (Long Term):**\n"
+            "(Focus: Vision, Moat, CapEx 3-5yrs)\n\n"
+            "2️⃣ **Near-Term Guidance:**\n"
+            "(Focus: Revenue/Margin Forecasts, Growth Drivers)\n\n"
+            "3️⃣ **Management Tone & Specifics:**\n"
+            "(Focus: Confidence level, RoCE targets, Project Timelines)\n\n"
+            "🎯 **GROWTH VERDICT:** [High Growth / Stable / Risk] | [Confidence %]"
+        ),
+    },
+    # --- PROMPT B: STANDARD 3-3-3 RULE (Telegraphic) ---
+    "STANDARD": {
+        "char_cap": 30000,
+        "context": "CTX: STOCK {symbol} | CMP {current_price} | TYPE: FILING\n",
+        "doc": "DATA: {text}\n",
+        "instructions": (
+            "ROLE: Quant Algo. MODE: Telegraphic. No filler words.\n"
+            "TASK: 3-3-3 RULE. List exactly 3 PROS, 3 CONS, 3 HIGHLIGHTS.\n"
+            "STYLE: Fragment sentences. Data dense.\n\n"
+            "OUTPUT FORMAT:\n"
+            "📊 **ANALYSIS: {symbol}**\n"
+            "💰 **CMP:** {current_price}\n"
+            "🎯 **BUY:** [Range] | **STOP:** [Level]\n\n"
+            "✅ **PROS:**\n1. [Point]\n2. [Point]\n3. [Point]\n\n"
+            "⚠️ **CONS:**\n1. [Point]\n2. [Point]\n3. [Point]\n\n"
+            "💡 **HIGHLIGHTS:**\n1. [Point]\n2. [Point]\n3. [Point]\n\n"
+            "⚖️ **VERDICT:** [BULL/BEAR] | [Conf%]"
+        ),
+    },
+}
 
 # --- PDF ANALYZER (DUAL MODE) ---
+PRICE_TTL = 300 # A quote is reused for at most five minutes, so "CMP" stays current
+
+@lru_cache(maxsize=512)
+def _cmp(yf_symbol, window):
+    # `window` (time // PRICE_TTL) is only part of the cache key: a new window means a fresh quote
+    import yfinance as yf # Imported lazily: only the PDF path needs a live quote
+    # Only Close is read: skip the dividend/split columns and the adjustment pass
+    price_data = yf.Ticker(yf_symbol).history(period="1d", auto_adjust=False, actions=False)
+    if price_data.empty:
+        raise LookupError(yf_symbol) # Not cached, so the next call retries
+    return round(price_data['Close'].iat[-1], 2) # Positional scalar read, no indexer dispatch
+
+def get_current_price(symbol):
+    yf_symbol = symbol if symbol.endswith('.NS') else f"{symbol}.NS"
+    try:
+        return _cmp(yf_symbol, int(time.time() // PRICE_TTL))
+    except LookupError:
+        return 0
+
 def analyze_pdf_report(symbol, pdf_url, mode="STANDARD"):
     print(f"📥 Fetching PDF & Price Data (Mode: {mode})...")
+    pool = ThreadPoolExecutor(max_workers=1)
     try:
-        # 1. Price Context
-        yf_ticker = yf.Ticker(symbol if symbol.endswith('.NS') else f"{symbol}.NS")
-        price_data = yf_ticker.history(period="1d")
-        current_price = round(price_data['Close'].iloc[-1], 2) if not price_data.empty else 0
-
-        # 2. Download PDF
-        headers = {"User-Agent": "Mozilla/5.0"}
-        r = requests.get(pdf_url, headers=headers, timeout=15)
-        r.raise_for_status()
-        
-        # 3. Extract Text
-        f = io.BytesIO(r.content)
-        reader = PdfReader(f)
-        text_content = ""
-        max_pages = min(len(reader.pages), 30) # 30 pages for deep reading
-        for i in range(max_pages):
-            text = reader.pages[i].extract_text()
-            if text: text_content += text
-
-        # 4. Select Prompt Based on Mode
-        model = genai.GenerativeModel('gemini-2.5-flash') 
-        
-        if mode == "FUTURE":
-            # --- PROMPT A: STRATEGIC FUTURE OUTLOOK ---
-            prompt = (
-                f"CTX: STOCK {symbol} | CMP {current_price} | DOC TYPE: Corporate Filing\n"
-                f"DOC TEXT (First {max_pages} pgs): {text_content[:90000]}\n"
-                "ROLE: Senior Growth Strategist.\n"
-                "TASK: Analyze specifically for FUTURE PROSPECTS & GROWTH STRATEGY.\n"
-                "INSTRUCTIONS: Detect doc type (Annual/Quarterly/Concall) and extract forward-looking info.\n\n"
-                "OUTPUT FORMAT (Strictly):\n"
-                "🚀 **STRATEGIC FUTURE OUTLOOK: {symbol}**\n\n"
-                "1️⃣ **Strategic Outlook (Long Term):**\n"
-                "(Focus: Vision, Moat, CapEx 3-5yrs)\n\n"
-                "2️⃣ **Near-Term Guidance:**\n"
-                "(Focus: Revenue/Margin Forecasts, Growth Drivers)\n\n"
-                "3️⃣ **Management Tone & Specifics:**\n"
-                "(Focus: Confidence level, RoCE targets, Project Timelines)\n\n"
-                "🎯 **GROWTH VERDICT:** [High Growth / Stable / Risk] | [Confidence %]"
-            )
+        # 1. Price Context, fetched while the PDF downloads and parses
+        price_job = pool.submit(get_current_price, symbol)
+        prompt = PDF_PROMPTS.get(mode, PDF_PROMPTS["STANDARD"])
+        char_cap = prompt["char_cap"]
+
+        # 2. Reuse extracted text if this filing was parsed recently
+        cache_file = _cache_path(PDF_CACHE_DIR, f"{pdf_url}|{char_cap}")
+        cached = read_cache(cache_file)
+        if cached:
+            print("🗃️ PDF text cache hit")
+            doc = json.loads(cached)
+            text_content, max_pages = doc['text'], doc['pages']
         else:
-            # --- PROMPT B: STANDARD 3-3-3 RULE (Telegraphic) ---
-            prompt = (
-                f"CTX: STOCK {symbol} | CMP {current_price} | TYPE: FILING\n"
-                f"DATA: {text_content[:30000]}\n"
-                "ROLE: Quant Algo. MODE: Telegraphic. No filler words.\n"
-                "TASK: 3-3-3 RULE. List exactly 3 PROS, 3 CONS, 3 HIGHLIGHTS.\n"
-                "STYLE: Fragment sentences. Data dense.\n\n"
-                "OUTPUT FORMAT:\n"
-                "📊 **ANALYSIS: {symbol}**\n"
-                "💰 **CMP:** {current_price}\n"
-                "🎯 **BUY:** [Range] | **STOP:** [Level]\n\n"
-                "✅ **PROS:**\n1. [Point]\n2. [Point]\n3. [Point]\n\n"
-                "⚠️ **CONS:**\n1. [Point]\n2. [Point]\n3. [Point]\n\n"
-                "💡 **HIGHLIGHTS:**\n1. [Point]\n2. [Point]\n3. [Point]\n\n"
-                "⚖️ **VERDICT:** [BULL/BEAR] | [Conf%]"
-            )
-        
-        response = model.generate_content(prompt)
-        return response.text.strip()
+            # 3. Stream the PDF to a temp file instead of holding the whole body in RAM
+            fingerprint = hashlib.sha256()
+            with SESSION.get(pdf_url, timeout=15, stream=True) as r, \
+                    tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+                r.raise_for_status()
+                # Bail on HTML error pages and oversized files before reading the body
+                content_type = r.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                if content_type.startswith("text/") or "html" in content_type:
+                    raise ValueError(f"URL is not a PDF ({content_type})")
+                if int(r.headers.get("Content-Length") or 0) > MAX_PDF_BYTES:
+                    raise ValueError(f"PDF larger than {MAX_PDF_BYTES >> 20} MB")
+
+                size = 0
+                for chunk in r.iter_content(64 << 10):
+                    size += len(chunk)
+                    if size > MAX_PDF_BYTES: # Content-Length can be missing or wrong
+                        raise ValueError(f"PDF larger than {MAX_PDF_BYTES >> 20} MB")
+                    pdf_file.write(chunk)
+                    fingerprint.update(chunk)
+                pdf_file.flush()
+
+                # 4. Extract Text, unless the same file was already parsed under another URL
+                content_file = _cache_path(PDF_CACHE_DIR, f"sha256:{fingerprint.hexdigest()}|{char_cap}")
+                cached = read_cache(content_file)
+                if cached:
+                    print("🗃️ PDF content cache hit")
+                    doc = json.loads(cached)
+                    text_content, max_pages = doc['text'], doc['pages']
+                else:
+                    text_content, max_pages = extract_pdf_text(pdf_file.name, char_cap)
+
+            if text_content:
+                entry = json.dumps({"pages": max_pages, "text": text_content})
+                write_cache(cache_file, entry)
+                write_cache(content_file, entry)
+
+        current_price = price_job.result()
+
+        # 5. Fill the mode's prompt template
+        context = prompt["context"].format(symbol=symbol, current_price=current_price)
+        doc = prompt["doc"].format(pages=max_pages, text=text_content)
+        instructions = prompt["instructions"]
+
+        # 6. Same filing, mode and CMP => same prompt, so a recent answer can be reused as-is
+        answer_file = _cache_path(GEMINI_CACHE_DIR, f"{FLASH_MODEL.model_name}|{context}{doc}{instructions}")
+        cached = read_cache(answer_file)
+        if cached:
+            print("🗃️ Gemini answer cache hit")
+            return cached
+
+        # 7. Ask Gemini
+        response = FLASH_MODEL.generate_content(context + doc + instructions)
+        answer = response.text.strip()
+        write_cache(answer_file, answer)
+        return answer
 
     except Exception as e:
         return f"❌ Analysis Failed: {str(e)}"
+    finally:
+        pool.shutdown(wait=False)
 
 # --- STANDARD ANALYZERS ---
+VERDICT_CACHE_DIR = "/tmp/ai_verdict_cache"
+VERDICT_CACHE_TTL = 3600
+
 def get_ai_verdict(stock, content):
+    # Google News repeats the same headlines across runs; identical input gets the cached verdict
+    cache_file = _cache_path(VERDICT_CACHE_DIR, f"{stock}|{content}")
+    cached = read_cache(cache_file, ttl=VERDICT_CACHE_TTL)
+    if cached:
+        print(f"🗃️ Verdict cache: HIT ({stock})")
+        return cached
+    print(f"🗃️ Verdict cache: MISS ({stock})")
+
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
         prompt = f"STOCK: {stock}. DATA: {content}. OUTPUT: Telegraphic style. Verdict: [BUY/SELL] | Reason."
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        response = FLASH_MODEL.generate_content(prompt)
+        verdict = response.text.strip()
     except:
         return "Error in AI."
 
+    write_cache(cache_file, verdict)
+    return verdict
+
 def check_for_quarterly_results(symbol):
     return None # Simplified for this update
 
+RSS_URL = "https://news.google.com/rss/search?q={}&hl=en-IN&gl=IN&ceid=IN:en"
+
+# Memoized so a symbol whose news was already fetched (e.g. by batch_analyze) isn't fetched again
+@lru_cache(maxsize=128)
+def fetch_recent_news(symbol):
+    rss_url = RSS_URL.format(urllib.parse.quote_plus(f"{symbol} share news india"))
+    # Fetch on the pooled session (keep-alive, timeout, retries) rather than a bare urllib call
+    r = SESSION.get(rss_url, timeout=5)
+    r.raise_for_status()
+
+    # Only title/link/pubDate of the first few items are read, so a plain ElementTree walk is enough.
+    # Raw bytes, so the parser decodes by the feed's own XML declaration rather than requests' charset guess.
+    root = ET.fromstring(r.content)
+
+    # pubDate is RFC 822 with a zone, so compare epochs against one precomputed cutoff
+    cutoff = time.time() - 48 * 3600
+    recent_news = []
+    for item in root.findall('channel/item')[:3]:
+        published = parsedate_tz(item.findtext('pubDate') or "")
+        if published and mktime_tz(published) > cutoff:
+            recent_news.append({'title': item.findtext('title', ""), 'link': item.findtext('link', "")})
+    return recent_news
+
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{}"
+
+def fetch_technicals(symbol, yf_symbol):
+    # Only the last close and the 50-DMA are needed, so read the chart JSON directly
+    # instead of building a yfinance DataFrame and a full rolling series.
+    try:
+        r = SESSION.get(
+            YAHOO_CHART_URL.format(yf_symbol),
+            params={"range": "100d", "interval": "1d"},
+            timeout=5,
+        )
+        r.raise_for_status()
+        result = r.json()['chart']['result']
+        if not result:
+            return f"❌ Data Error: {symbol}"
+
+        # Adjusted closes match yf.download's default (auto_adjust), so a recent split can't fake a crash
+        indicators = result[0]['indicators']
+        series = (indicators.get('adjclose') or indicators['quote'])[0]
+        closes = [c for c in (series.get('adjclose') or series.get('close') or []) if c is not None]
+        if len(closes) > 50:
+            cur = closes[-1]
+            dma = sum(closes[-50:]) / 50
+            status = "BULLISH" if cur > dma else "BEARISH"
+            diff = ((cur - dma) / dma) * 100
+            return f"📉 **Tech:** {symbol}\nStart: {status}\nVs 50DMA: {diff:.2f}%"
+        return f"ℹ️ No Data: {symbol}"
+    except Exception as e:
+        return f"❌ Error: {e}"
+
 def analyze_stock(symbol, chat_id, specific_url=None, mode="STANDARD"):
     # --- PATH A: PDF DEEP DIVE ---
     if specific_url and len(specific_url) > 5:
         msg_header = "🔮 **Analyzing Future Outlook...**" if mode == "FUTURE" else "🔄 **Processing Doc...**"
-        send_telegram(chat_id, f"{msg_header}\n`{specific_url.split('/')[-1]}`")
-        
-        analysis = analyze_pdf_report(symbol, specific_url, mode)
+        # Post the ack from a worker so the download starts right away; wait on it so it still lands first
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            ack = pool.submit(send_telegram, chat_id, f"{msg_header}\n`{specific_url.split('/')[-1]}`")
+            analysis = analyze_pdf_report(symbol, specific_url, mode)
+            ack.result()
         send_telegram(chat_id, analysis)
         return
 
     # --- PATH B: AUTO SCAN (Standard 3-3-3 logic applies here) ---
     yf_symbol = symbol if symbol.endswith('.NS') else f"{symbol}.NS"
-    
-    # Simple News Check
-    query = f"{symbol} share news india"
-    rss_url = f"https://news.google.com/rss/search?q={urllib.parse.quote(query)}&hl=en-IN&gl=IN&ceid=IN:en"
-    feed = feedparser.parse(rss_url)
-    
-    recent_news = []
-    for entry in feed.entries[:3]:
-        if hasattr(entry, 'published_parsed'):
-            if datetime.now() - datetime(*entry.published_parsed[:6]) < timedelta(hours=48):
-                recent_news.append(entry)
-
-    if recent_news:
-        ai_resp = get_ai_verdict(symbol, recent_news[0]['title'])
-        send_telegram(chat_id, f"📰 **NEWS: {symbol}**\n{ai_resp}\n🔗 [Link]({recent_news[0]['link']})")
+
+    # All three sources are network-bound, so fetch them speculatively in parallel
+    # and pick the highest-priority hit: Results > News > Technicals.
+    pool = ThreadPoolExecutor(max_workers=3)
+    try:
+        results_job = pool.submit(check_for_quarterly_results, symbol)
+        news_job = pool.submit(fetch_recent_news, symbol) # Same cached call as batch_analyze; only the top headline is used
+        tech_job = pool.submit(fetch_technicals, symbol, yf_symbol)
+
+        try:
+            results = results_job.result()
+        except Exception as e:
+            print(f"Results Error: {e}")
+            results = None
+        if results:
+            send_telegram(chat_id, results)
+            return
+
+        try:
+            recent_news = news_job.result()[:1]
+        except Exception as e:
+            print(f"News Error: {e}")
+            recent_news = []
+        if recent_news:
+            ai_resp = get_ai_verdict(symbol, recent_news[0]['title'])
+            send_telegram(chat_id, f"📰 **NEWS: {symbol}**\n{ai_resp}\n🔗 [Link]({recent_news[0]['link']})")
+            return
+
+        # Technical Fallback
+        send_telegram(chat_id, tech_job.result())
+    finally:
+        # Don't hold the process open for fetches whose result we no longer need
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# --- BATCH ANALYZER ---
+def _safe_news(symbol):
+    try:
+        return fetch_recent_news(symbol)
+    except Exception as e:
+        print(f"News Error ({symbol}): {e}")
+        return []
+
+def _split_sections(text):
+    # Maps each "## SYMBOL" heading in a batched reply to the text under it
+    sections = {}
+    for block in ("\n" + text).split("\n## ")[1:]:
+        head, _, body = block.partition("\n")
+        sections[head.strip(" *").upper()] = body.strip()
+    return sections
+
+def batch_analyze(symbols, chat_ids):
+    """News verdicts for many symbols in one Gemini call; symbols without fresh news take the normal path."""
+    if len(chat_ids) == 1:
+        chat_ids = chat_ids * len(symbols)
+    targets = dict(zip(symbols, chat_ids))
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        news = dict(zip(symbols, pool.map(_safe_news, symbols)))
+
+    with_news = [s for s in symbols if news[s]]
+    for symbol in symbols:
+        if not news[symbol]:
+            analyze_stock(symbol, targets[symbol])
+    if not with_news:
         return
 
-    # Technical Fallback
+    blocks = []
+    for symbol in with_news:
+        headlines = "\n".join(f"- {entry['title']}" for entry in news[symbol])
+        blocks.append(f"### {symbol}\nNEWS:\n{headlines}")
+    prompt = (
+        "ROLE: Algorithmic Trader. OUTPUT: Telegraphic style.\n"
+        "TASK: For EACH stock below, judge the impact of its news.\n"
+        "OUTPUT FORMAT: One section per stock, in the given order. Start each section with a line "
+        "'## SYMBOL' (symbol exactly as given), followed by: Verdict: [BUY/SELL] | Reason.\n\n"
+        + "\n\n".join(blocks)
+    )
     try:
-        data = yf.download(yf_symbol, period="100d", interval="1d", progress=False)
-        if isinstance(data.columns, pd.MultiIndex): data.columns = data.columns.get_level_values(0)
-        
-        if 'Close' in data.columns:
-            data = data.dropna(subset=['Close'])
-            if len(data) > 50:
-                cur = data['Close'].iloc[-1]
-                dma = data['Close'].rolling(50).mean().iloc[-1]
-                status = "BULLISH" if cur > dma else "BEARISH"
-                diff = ((cur - dma) / dma) * 100
-                msg = f"📉 **Tech:** {symbol}\nStart: {status}\nVs 50DMA: {diff:.2f}%"
-                send_telegram(chat_id, msg)
-            else:
-                send_telegram(chat_id, f"ℹ️ No Data: {symbol}")
-        else:
-            send_telegram(chat_id, f"❌ Data Error: {symbol}")
+        sections = _split_sections(FLASH_MODEL.generate_content(prompt).text)
     except Exception as e:
-        send_telegram(chat_id, f"❌ Error: {e}")
+        print(f"Batch AI Error: {e}")
+        sections = {}
+
+    outbox = []
+    for symbol in with_news:
+        top = news[symbol][0]
+        # A section the model skipped or mangled gets a single-symbol call instead
+        ai_resp = sections.get(symbol.upper()) or get_ai_verdict(symbol, top['title'])
+        outbox.append((targets[symbol], f"📰 **NEWS: {symbol}**\n{ai_resp}\n🔗 [Link]({top['link']})"))
+    send_many(outbox)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--symbol", required=True)
-    parser.add_argument("--chat_id", required=True)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--symbol")
+    target.add_argument("--symbols", help="Comma-separated symbols, analyzed in one batched AI call")
+    parser.add_argument("--chat_id", required=True, help="Chat ID, or one per symbol (comma-separated) with --symbols")
     parser.add_argument("--url", default="", help="Optional PDF URL")
     parser.add_argument("--mode", default="STANDARD", help="Analysis Mode: STANDARD or FUTURE")
     args = parser.parse_args()
+    _init()
 
-    analyze_stock(args.symbol, args.chat_id, args.url, args.mode)
+    if args.symbols:
+        symbols = [s.strip() for s in args.symbols.split(',') if s.strip()]
+        chat_ids = [c.strip() for c in args.chat_id.split(',') if c.strip()]
+        if len(chat_ids) not in (1, len(symbols)):
+            parser.error("--chat_id needs one ID, or one per symbol")
+        batch_analyze(symbols, chat_ids)
+    else:
+        analyze_stock(args.symbol, args.chat_id, args.url, args.mode)
@@ -1,136 +1,391 @@
 import os
+import sys
 import json
+import re
+import hashlib
 import time
+import calendar
+from collections import OrderedDict
 import feedparser
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import google.generativeai as genai
 import urllib.parse
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 
 # --- CONFIGURATION ---
-BOT_TOKEN = os.environ['TELEGRAM_BOT_TOKEN']
-CHAT_ID = os.environ['TELEGRAM_CHAT_ID']
-GEMINI_API_KEY = os.environ['GEMINI_API_KEY']
+BOT_TOKEN = None
+CHAT_ID = None
+GEMINI_API_KEY = None
 
-genai.configure(api_key=GEMINI_API_KEY)
+def _init():
+    global BOT_TOKEN, CHAT_ID, GEMINI_API_KEY
+    missing = [k for k in ('TELEGRAM_BOT_TOKEN', 'TELEGRAM_CHAT_ID', 'GEMINI_API_KEY') if not os.environ.get(k)]
+    if missing:
+        sys.exit(f"❌ Missing env vars: {', '.join(missing)}")
+    BOT_TOKEN = os.environ['TELEGRAM_BOT_TOKEN']
+    CHAT_ID = os.environ['TELEGRAM_CHAT_ID']
+    GEMINI_API_KEY = os.environ['GEMINI_API_KEY']
+    genai.configure(api_key=GEMINI_API_KEY)
+
+FLASH_MODEL = genai.GenerativeModel('gemini-2.5-flash') # Built once, shared by every call
+
+# One script for both modes: BOT_DEBUG=1 for the per-headline trace, BOT_FILTER_HOLD=0 to alert on HOLD too
+DEBUG = os.getenv("BOT_DEBUG") == "1"
+FILTER_HOLD = os.getenv("BOT_FILTER_HOLD", "1") == "1"
+
+def debug(msg):
+    if DEBUG:
+        print(msg)
+
+# One pooled session for the whole scan so every alert reuses the same TLS connection to Telegram.
+# Only GETs retry; POSTs are never retried so a slow sendMessage can't turn into a duplicate alert.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"]),
+))
+SESSION.headers.update({"User-Agent": "Mozilla/5.0"}) # Same UA as instant_analyst; some hosts throttle the default python-requests one
+
+def _is_markdown_error(resp):
+    # Only a parse failure is worth resending as plain text; "chat not found" or "too long" would fail again
+    try:
+        return "can't parse entities" in resp.json().get('description', '').lower()
+    except ValueError:
+        return False
+
+def _post_telegram(user_id, message):
+    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+    payload = {
+        "chat_id": user_id.strip(), 
+        "text": message, 
+        "parse_mode": "Markdown", 
+        "disable_web_page_preview": True
+    }
+    try:
+        resp = SESSION.post(url, json=payload, timeout=10)
+        debug(f"   --> Telegram Status: {resp.status_code}")
+        # A digest carries many headlines and Gemini text; one stray '_', '*' or '[' makes Telegram
+        # reject the whole Markdown message, so resend it as plain text rather than lose every alert in it
+        if resp.status_code == 400 and _is_markdown_error(resp):
+            print(f"   --> Telegram Rejected Markdown, resending as plain text: {resp.text[:200]}")
+            del payload["parse_mode"]
+            resp = SESSION.post(url, json=payload, timeout=10)
+        if resp.status_code != 200:
+            print(f"   --> Telegram Error: {resp.status_code} {resp.text[:200]}")
+    except Exception as e:
+        print(f"   --> Telegram Error: {e}")
+
+TELEGRAM_CHUNK = 4000 # Under Telegram's 4096 limit
+
+def pack_alerts(alerts, limit=TELEGRAM_CHUNK):
+    """Greedy-packs whole alerts into as few messages as fit, so one scan costs a handful of sends."""
+    digests, buf = [], ""
+    for alert in alerts:
+        if buf and len(buf) + 2 + len(alert) > limit:
+            digests.append(buf)
+            buf = ""
+        buf = f"{buf}\n\n{alert}" if buf else alert
+    if buf:
+        digests.append(buf)
+    return digests
 
 def send_telegram(message):
+    # Every chat gets the same message, so post to all of them at once instead of one after another
     ids = CHAT_ID.split(',')
-    for user_id in ids:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": user_id.strip(), 
-            "text": message, 
-            "parse_mode": "Markdown", 
-            "disable_web_page_preview": True
-        }
-        try:
-            resp = requests.post(url, json=payload)
-            print(f"   --> Telegram Status: {resp.status_code}") # DEBUG PRINT
-        except Exception as e:
-            print(f"   --> Telegram Error: {e}")
-
-def get_ai_signal(stock, news_title):
+    with ThreadPoolExecutor(max_workers=min(8, len(ids))) as pool:
+        list(pool.map(lambda user_id: _post_telegram(user_id, message), ids))
+
+AI_BATCH = 10 # Headlines per Gemini call
+AI_ERROR = {"signal": "HOLD", "confidence": "Low", "why": "Error"}
+
+# Gemini fills this schema directly, so replies are always parseable and signal is always one of the enum values
+SIGNAL_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "INTEGER"},
+            "signal": {"type": "STRING", "enum": ["BUY", "SELL", "HOLD"]},
+            "confidence": {"type": "STRING", "enum": ["High", "Med"]},
+            "why": {"type": "STRING"},
+        },
+        "required": ["id", "signal", "confidence", "why"],
+    },
+}
+
+def get_ai_signals(items):
+    """Rates a batch of (stock, title) pairs in one Gemini call; returns one {signal, confidence, why} per pair."""
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
+        news = [{"id": i, "stock": stock, "news": title} for i, (stock, title) in enumerate(items)]
         prompt = (
-            f"NEWS: {news_title}\n"
-            f"STOCK: {stock}\n"
             "ROLE: Algorithmic Trader.\n"
-            "TASK: Analyze impact.\n"
-            "OUTPUT: Signal: [BUY/SELL/HOLD] | Confidence: [High/Med] | Why: [5 words max]."
+            "TASK: Analyze the impact of each NEWS item on its STOCK.\n"
+            "OUTPUT: One verdict per item, same id; why is 5 words max.\n"
+            f"ITEMS: {json.dumps(news, ensure_ascii=False)}"
         )
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        response = FLASH_MODEL.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json", "response_schema": SIGNAL_SCHEMA},
+        )
+        by_id = {v["id"]: v for v in json.loads(response.text)}
     except Exception as e:
         print(f"   --> AI Error: {e}")
-        return "Signal: HOLD | Confidence: Low | Why: Error"
+        return [AI_ERROR] * len(items)
+
+    # An item the model skipped falls back to the error verdict
+    return [{k: by_id[i][k] for k in ("signal", "confidence", "why")} if i in by_id else AI_ERROR for i in range(len(items))]
+
+def format_signal(v):
+    return f"Signal: {v['signal']} | Confidence: {v['confidence']} | Why: {v['why']}"
+
+def news_key(news_id):
+    # 64-bit digest instead of the "{stock}_{title[:40]}" string: fixed size on disk and a cheap int hash in the set.
+    # hashlib, not hash(), because str hashes change between runs.
+    return int.from_bytes(hashlib.blake2b(news_id.encode(), digest_size=8).digest(), 'big')
+
+MEMORY_LIMIT = 2000
+
+def write_json(path, data):
+    # Write to a temp file and rename, so a run killed mid-save leaves the previous file intact
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+class LRUSet:
+    """Set that remembers use order, so trimming to MEMORY_LIMIT drops the stalest ids, not arbitrary ones."""
+    def __init__(self, items=()):
+        self.d = OrderedDict.fromkeys(items)
+        self.dirty = False # Set by adds and touches alike, so a run that only reorders still saves
+
+    def __contains__(self, key):
+        if key in self.d:
+            self.d.move_to_end(key) # Still in the feed: keep it remembered
+            self.dirty = True
+            return True
+        return False
+
+    def __len__(self):
+        return len(self.d)
+
+    def add(self, key):
+        self.d[key] = None
+        self.d.move_to_end(key)
+        self.dirty = True
+
+    def recent(self, n):
+        return list(self.d)[-n:]
 
 def load_memory():
     try:
         with open('news_memory.json', 'r') as f:
-            return set(json.load(f))
+            # Oldest first, as saved. Older files hold the raw id strings; hash them so they keep deduping
+            return LRUSet(item if isinstance(item, int) else news_key(item) for item in json.load(f))
     except:
-        return set()
+        return LRUSet()
 
-def save_memory(memory_set):
-    recent_items = list(memory_set)[-2000:]
-    with open('news_memory.json', 'w') as f:
-        json.dump(recent_items, f)
+def save_memory(memory):
+    write_json('news_memory.json', memory.recent(MEMORY_LIMIT))
+
+VERDICT_FILE = 'verdicts.json'
+VERDICT_LIMIT = 2000
+
+def verdict_key(stock, title):
+    # Full title, unlike the memory id, so two headlines sharing 40 chars don't share a verdict
+    return hashlib.sha1(f"{stock}|{title}".encode()).hexdigest()
+
+def load_verdicts():
+    # Verdicts from earlier runs: a headline that comes back after a dropped run isn't re-rated
+    try:
+        with open(VERDICT_FILE, 'r') as f:
+            return json.load(f)
+    except:
+        return {}
+
+def save_verdicts(verdicts):
+    recent = dict(list(verdicts.items())[-VERDICT_LIMIT:]) # dicts keep insertion order: newest last
+    write_json(VERDICT_FILE, recent)
+
+FEED_WORKERS = 16 # RSS fetches are pure network waits
+FEED_BUDGET = 90 # Seconds of the 270s run the feed phase may use; the rest is for AI + Telegram
+AI_WORKERS = 5 # Concurrent Gemini calls, kept low to stay under the API rate limit
+AI_PACING = 1.5 # Seconds each AI worker rests after a call
+
+RSS_URL = "https://news.google.com/rss/search?q={}&hl=en-IN&gl=IN&ceid=IN:en"
+
+# Headlines with none of these words are rated HOLD without asking Gemini (prefix match: "orders", "resigns", ...)
+SIGNAL_WORDS = re.compile(
+    r"\b(split|bonus|fraud|raid|loss|resign|expansion|order|acqui|profit|fine|penalt|merger|buyback"
+    r"|result|earning|dividend|stake|contract|deal|upgrade|downgrade)",
+    re.I,
+)
+
+def fetch_feed(stock):
+    rss_url = RSS_URL.format(urllib.parse.quote_plus(f"{stock} share news india"))
+    try:
+        # Fetch on the pooled session (keep-alive, gzip, timeout, retries) and hand feedparser the bytes,
+        # instead of letting it open its own urllib connection with no timeout
+        r = SESSION.get(rss_url, timeout=10)
+        r.raise_for_status()
+        return feedparser.parse(r.content)
+    except Exception:
+        return None
+
+def _paced_signals(items):
+    verdicts = get_ai_signals(items)
+    time.sleep(AI_PACING) # Per-worker throttle in place of the old sleep between headlines
+    return verdicts
 
 def check_market_news():
-    print(f"🚀 STARTING DEBUG SCAN...")
+    print(f"🚀 STARTING {'DEBUG ' if DEBUG else ''}SCAN...")
     
     with open('watchlist.txt', 'r') as f:
         stocks = [line.strip() for line in f if line.strip()]
     
     seen_news = load_memory()
-    initial_count = len(seen_news)
     
     start_time = time.time()
-    
+
+    # 1. Fetch every feed at once: the scan waits on the network, not the CPU.
+    # Collect them as they land so one stalled feed can't eat the whole run.
+    feeds = {}
+    pool = ThreadPoolExecutor(max_workers=FEED_WORKERS)
+    try:
+        jobs = {pool.submit(fetch_feed, stock): stock for stock in stocks}
+        for job in as_completed(jobs, timeout=FEED_BUDGET):
+            feeds[jobs[job]] = job.result()
+    except FuturesTimeout:
+        print(f"⏳ Feed Time Limit Reached: {len(stocks) - len(feeds)} feeds still pending.")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # 2. Age + duplicate checks, in watchlist order
+    cutoff = start_time - 24 * 3600
+    candidates, queued = [], set()
     for i, stock in enumerate(stocks):
-        if (time.time() - start_time) > 270: 
-            print("⏳ Time Limit Reached.")
-            break
+        debug(f"\n[{i+1}/{len(stocks)}] Checking {stock}...")
 
-        print(f"\n[{i+1}/{len(stocks)}] Checking {stock}...") # DEBUG PRINT
+        if stock not in feeds:
+            debug("   --> Feed timed out")
+            continue
 
-        query = f"{stock} share news india"
-        encoded_query = urllib.parse.quote(query)
-        rss_url = f"https://news.google.com/rss/search?q={encoded_query}&hl=en-IN&gl=IN&ceid=IN:en"
-        
-        try:
-            feed = feedparser.parse(rss_url)
-        except:
-            print("   --> Failed to parse feed")
+        feed = feeds[stock]
+        if feed is None:
+            debug("   --> Failed to parse feed")
             continue
         
         if not feed.entries:
-            print("   --> No news found in RSS.")
+            debug("   --> No news found in RSS.")
             continue
 
         for entry in feed.entries[:3]: # Check top 3
             title = entry.title
             link = entry.link
             
-            # Age Check
-            if hasattr(entry, 'published_parsed'):
-                news_time = datetime(*entry.published_parsed[:6])
-                age_hours = (datetime.now() - news_time).total_seconds() / 3600
-                if age_hours > 24:
-                    print(f"   --> Skipped: Too old ({age_hours:.1f} hours ago) - {title[:30]}...")
-                    continue
+            # Age Check: published_parsed is UTC, so compare epochs against one precomputed cutoff
+            published = entry.get('published_parsed')
+            if published and calendar.timegm(published) < cutoff:
+                age_hours = (start_time - calendar.timegm(published)) / 3600
+                debug(f"   --> Skipped: Too old ({age_hours:.1f} hours ago) - {title[:30]}...")
+                continue
             
             # Duplicate Check
-            news_id = f"{stock}_{title[:40]}"
-            if news_id in seen_news:
-                print(f"   --> Skipped: Already in Memory - {title[:30]}...")
+            news_id = news_key(f"{stock}_{title[:40]}")
+            if news_id in seen_news or news_id in queued:
+                debug(f"   --> Skipped: Already in Memory - {title[:30]}...")
                 continue 
+
+            # Keyword Check: only worth a Gemini call when a quiet headline would be filtered anyway
+            if FILTER_HOLD and not SIGNAL_WORDS.search(title):
+                debug(f"   --> Skipped: No signal words - {title[:60]}")
+                continue
+
+            debug(f"   ⚡ Sending to AI: {title[:40]}...")
+            candidates.append((stock, title, link, news_id))
+            queued.add(news_id)
+
+    # 3. AI Check: reuse stored verdicts, rate the rest AI_BATCH per call on a small pool
+    verdicts = load_verdicts()
+    # Only dicts count: entries from before structured output are plain text and get re-rated
+    pending = [c for c in candidates if not isinstance(verdicts.get(verdict_key(c[0], c[1])), dict)]
+    print(f"\n🗃️ Verdict cache: {len(candidates) - len(pending)} hits, {len(pending)} to rate")
+    alerts = []
+    pool = ThreadPoolExecutor(max_workers=AI_WORKERS)
+    batches, slots = [], {}
+
+    def store_finished():
+        # Write verdicts.json as soon as batches finish, independent of news_memory.json, so a run that
+        # crashes or times out before saving its memory still leaves the next run verdicts to reuse
+        changed = False
+        for entry in list(batches):
+            job, batch = entry
+            if not job.done() or job.cancelled() or job.exception():
+                continue
+            batches.remove(entry)
+            for (stock, title, _, _), ai_verdict in zip(batch, job.result()):
+                if ai_verdict != AI_ERROR: # Let a failed call be retried next run
+                    verdicts[verdict_key(stock, title)] = ai_verdict
+                    changed = True
+        if changed:
+            save_verdicts(verdicts)
+
+    try:
+        for i in range(0, len(pending), AI_BATCH):
+            batch = pending[i:i + AI_BATCH]
+            job = pool.submit(_paced_signals, [(stock, title) for stock, title, _, _ in batch])
+            batches.append((job, batch))
+            for pos, (stock, title, _, _) in enumerate(batch):
+                slots[verdict_key(stock, title)] = (job, pos)
+
+        # Alerts still go out in watchlist order
+        for stock, title, link, news_id in candidates:
+            if (time.time() - start_time) > 270: 
+                print("⏳ Time Limit Reached.")
+                break
+
+            key = verdict_key(stock, title)
+            if key in slots:
+                job, pos = slots[key]
+                ai_verdict = job.result()[pos]
+                store_finished()
+            else:
+                ai_verdict = verdicts[key] = verdicts.pop(key) # Move to the newest end: a reused verdict stays cached
+            debug(f"      AI VERDICT [{stock}]: {format_signal(ai_verdict)}")
             
-            # AI Check
-            print(f"   ⚡ Sending to AI: {title[:40]}...")
-            ai_verdict = get_ai_signal(stock, title)
-            print(f"      AI VERDICT: {ai_verdict}") # DEBUG PRINT
-            
-            # Telegram Trigger
-            # Note: I removed the "Buy/Sell" filter so you ALWAYS get a message for testing
+            # Telegram Trigger: BUY/SELL only unless the HOLD filter is switched off.
+            # A rated headline is remembered even when filtered; a failed call is left for the next run.
+            if ai_verdict != AI_ERROR:
+                seen_news.add(news_id)
+            if FILTER_HOLD and ai_verdict["signal"] == "HOLD":
+                continue
+
             msg = (
                 f"🚨 **{stock}**\n"
-                f"{ai_verdict}\n"
+                f"{format_signal(ai_verdict)}\n"
                 f"📰 {title}\n"
                 f"[Source]({link})"
             )
-            send_telegram(msg)
-            
-            seen_news.add(news_id)
-            time.sleep(1.5)
+            alerts.append(msg)
+    finally:
+        # Past the time limit, drop the calls that haven't started; keep whatever already finished
+        pool.shutdown(wait=False, cancel_futures=True)
+        store_finished()
+        if len(candidates) > len(pending):
+            save_verdicts(verdicts) # Reused entries moved to the newest end
+
+    # 4. One digest per ~4000 chars instead of a post per alert
+    for digest in pack_alerts(alerts):
+        send_telegram(digest)
 
-    if len(seen_news) > initial_count:
+    if seen_news.dirty:
         save_memory(seen_news)
         print("\n✅ Memory updated.")
     else:
-        print("\nℹ️ No new items to save.")
+        print("\nℹ️ Memory unchanged.")
 
 if __name__ == "__main__":
+    _init()
     check_market_news()